@@ -691,7 +691,7 @@ def get_library_stats(force_refresh: bool = False):
     if stats_data["tracks"] == 0 and stats_data["albums"] == 0:
         try:
             with open(ALBUMS_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
+                data = json.loads(f.read())
             stats_data["albums"] = len(data)
             stats_data["album_artists"] = len({a.get("albumartist") for a in data})
         except Exception:
@@ -763,7 +763,7 @@ def import_library(background_tasks: BackgroundTasks):
 def albums(limit: int = 5000):
     try:
         with open(ALBUMS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)[:limit]
+            return json.loads(f.read())[:limit]
     except Exception:
         return []
 
@@ -771,7 +771,7 @@ def albums(limit: int = 5000):
 def recent(limit: int = 12):
     try:
         with open(RECENT_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)[:limit]
+            return json.loads(f.read())[:limit]
     except Exception:
         return []
 
@@ -810,10 +810,13 @@ async def build_playlist(
             if "uri" in track:
                 track["uri"] = convert_path_to_mpd_uri(track["uri"])
         
-        # Save playlist locally
+        # Save playlist locally (atomic: temp file + rename so a reader
+        # never sees a half-written playlist)
         playlist_file = VOLUMIO_PLAYLIST_DIR / f"{playlist_name}.json"
-        with open(playlist_file, "w", encoding="utf-8") as f:
-            json.dump(playlist, f, indent=2)
+        temp_file = str(playlist_file) + ".tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            f.write(json.dumps(playlist, indent=2))
+        os.replace(temp_file, playlist_file)
         
         # ============================================================
         # PUSH TO VOLUMIO VIA MPD
@@ -896,7 +899,7 @@ def list_playlists():
         for file in VOLUMIO_PLAYLIST_DIR.glob("*.json"):
             try:
                 with open(file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
+                    data = json.loads(f.read())
                     playlists.append({
                         "name": file.stem,
                         "tracks": len(data) if isinstance(data, list) else 0,
@@ -217,59 +217,99 @@ class DuplicateFixer:
         """
         Fix a group of duplicate artists.
         Updates all items from duplicates to canonical name.
+
+        Uses one bulk UPDATE per duplicate inside a single transaction
+        (one commit total) and renames the artist directory in a single
+        syscall instead of item.store()+item.move() per track.
         """
         if canonical_name in duplicate_names:
             # Remove canonical from duplicates list
             to_fix = [d for d in duplicate_names if d != canonical_name]
         else:
             to_fix = duplicate_names
-        
+
         if not to_fix:
             self.logger.warning(f"No duplicates to fix for '{canonical_name}'")
             return 0
-        
+
         total_fixed = 0
-        
+
         for duplicate in to_fix:
             self.logger.info(f"\nFixing: '{duplicate}' -> '{canonical_name}'")
-            
-            # Find all items with this artist name
-            items = list(self.lib.items(f'albumartist:"{duplicate}"'))
-            items.extend(self.lib.items(f'artist:"{duplicate}"'))
-            
-            if not items:
+
+            # A duplicate can live in the track-level artist field alone
+            # (e.g. compilation tracks whose albumartist is "Various
+            # Artists"), so query both fields before deciding there is
+            # nothing to do.
+            album_items = list(self.lib.items(f'albumartist:"{duplicate}"'))
+            item_ids = {item.id for item in album_items}
+            item_ids.update(item.id for item in self.lib.items(f'artist:"{duplicate}"'))
+
+            if not item_ids:
                 self.logger.warning(f"  No items found for '{duplicate}'")
                 continue
-            
-            self.logger.info(f"  Found {len(items)} items to update")
-            
-            for item in items:
-                # Update artist names
-                if item.albumartist == duplicate:
-                    if self.dry_run:
-                        self.logger.info(f"  [DRY RUN] Would update albumartist: {item.path}")
-                    else:
-                        item.albumartist = canonical_name
-                        item.store()
-                        self.logger.info(f"  Updated albumartist: {item.path}")
-                    total_fixed += 1
-                
-                if item.artist == duplicate:
-                    if self.dry_run:
-                        self.logger.info(f"  [DRY RUN] Would update artist: {item.path}")
+
+            self.logger.info(f"  Found {len(item_ids)} items to update")
+
+            if self.dry_run:
+                if album_items:
+                    self.logger.info(f"  [DRY RUN] Would update {len(item_ids)} items and rename artist folder")
+                else:
+                    self.logger.info(f"  [DRY RUN] Would update {len(item_ids)} items (artist field only)")
+                total_fixed += len(item_ids)
+                continue
+
+            # All tracks of an artist share one parent directory, so rename
+            # that directory once instead of moving every file through beets.
+            # Only duplicates that own albums have a folder to rename;
+            # artist-only duplicates leave the layout untouched.
+            renamed = False
+            old_artist_dir = new_artist_dir = None
+            if album_items:
+                old_artist_dir = os.path.dirname(os.path.dirname(album_items[0].path))
+                new_artist_dir = os.path.join(os.path.dirname(old_artist_dir),
+                                              canonical_name.encode('utf-8', 'surrogateescape'))
+
+                if os.path.basename(old_artist_dir).decode('utf-8', 'surrogateescape') == duplicate:
+                    if not os.path.exists(new_artist_dir):
+                        os.rename(old_artist_dir, new_artist_dir)
+                        renamed = True
+                        self.logger.info(f"  Renamed folder: {old_artist_dir} -> {new_artist_dir}")
                     else:
-                        item.artist = canonical_name
-                        item.store()
-        
-        # Move files to new location
-        if not self.dry_run and total_fixed > 0:
-            self.logger.info(f"  Moving files to new artist folder...")
-            # Get updated items
-            items = list(self.lib.items(f'albumartist:"{canonical_name}"'))
-            for item in items:
-                item.move()
-            self.logger.info(f"  Files moved successfully")
-        
+                        self.logger.warning(f"  Target folder exists, will move files individually: {new_artist_dir}")
+                else:
+                    self.logger.warning(f"  Folder layout doesn't match artist name, will move files individually")
+
+            # One UPDATE per field, all inside a single transaction so
+            # SQLite commits once for the whole group.
+            with self.lib.transaction():
+                conn = self.lib._connection()
+                cur = conn.execute(
+                    "UPDATE items SET albumartist = ? WHERE albumartist = ?",
+                    (canonical_name, duplicate))
+                total_fixed += cur.rowcount
+                cur = conn.execute(
+                    "UPDATE items SET artist = ? WHERE artist = ?",
+                    (canonical_name, duplicate))
+                total_fixed += cur.rowcount
+                if renamed:
+                    # Refresh stored paths to match the renamed directory.
+                    # REPLACE() returns TEXT, and beets stores paths as
+                    # BLOBs (queries bind bytes and TEXT never equals
+                    # BLOB in SQLite), so cast the result back.
+                    conn.execute(
+                        "UPDATE items SET path = CAST(REPLACE(path, ?, ?) AS BLOB)"
+                        " WHERE albumartist = ?",
+                        (old_artist_dir, new_artist_dir, canonical_name))
+
+            self.logger.info(f"  Updated database for '{duplicate}'")
+
+            if album_items and not renamed:
+                # Fallback: let beets move the files one by one
+                for item in self.lib.items(f'albumartist:"{canonical_name}"'):
+                    item.move()
+                self.logger.info(f"  Files moved individually")
+
         return total_fixed
 
 
@@ -1,34 +1,112 @@
 #!/usr/bin/env python3
-import json
+import functools
+import heapq
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:
+    import json as _json
+
+    class orjson:  # minimal stand-in when orjson isn't installed
+        OPT_INDENT_2 = 1
+
+        @staticmethod
+        def dumps(obj, option=0):
+            indent = 2 if option & orjson.OPT_INDENT_2 else None
+            return _json.dumps(obj, indent=indent, ensure_ascii=False).encode("utf-8")
+
+        @staticmethod
+        def loads(data):
+            return _json.loads(data)
+
 ALBUMS_FILE = "/data/albums.json"
 RECENT_FILE = "/data/recent_albums.json"
 LIB_ROOT = "/music/library"
 
+# Stats are IO-latency bound (one seek per folder on spinning disks), so
+# keep many in flight at once instead of walking folders serially.
+STAT_THREADS = int(os.environ.get("STAT_THREADS", 32))
+
+# Output is machine-consumed; compact by default, PRETTY_JSON=1 to debug
+JSON_OPTS = orjson.OPT_INDENT_2 if os.environ.get("PRETTY_JSON") == "1" else 0
+
+def atomic_write(path, data):
+    """Write bytes to path atomically; fsync file and directory so the
+    rename survives a crash."""
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    dir_fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+@functools.lru_cache(maxsize=None)
+def _folder_mtime(abs_path):
+    # Single os.stat instead of getmtime (which stats again internally).
+    # Cached so album entries sharing a folder (multi-disc) stat it once.
+    try:
+        return os.stat(abs_path).st_mtime
+    except OSError:
+        return 0
+
+def get_album_mtime(a):
+    folder = a.get("folder", "")
+    return _folder_mtime(str(Path(LIB_ROOT) / folder.lstrip("/")))
+
+def scan_parent_mtimes(parent):
+    """One scandir per artist folder; DirEntry.stat() comes from the
+    readdir batch instead of a fresh path walk per album."""
+    mtimes = {}
+    try:
+        with os.scandir(parent) as it:
+            for entry in it:
+                try:
+                    mtimes[entry.path] = entry.stat().st_mtime
+                except OSError:
+                    pass
+    except OSError:
+        pass
+    return mtimes
+
 def main():
-    if not os.path.exists(ALBUMS_FILE):
+    # One open instead of exists()+open: saves a stat and can't race a
+    # concurrent writer swapping the file between the two calls
+    try:
+        with open(ALBUMS_FILE, "rb") as f:
+            albums = orjson.loads(f.read())
+    except FileNotFoundError:
         return
 
-    with open(ALBUMS_FILE, "r") as f:
-        albums = json.load(f)
-
-    # Get folder mtimes
-    for a in albums:
-        folder = a.get("folder", "")
-        abs_path = Path(LIB_ROOT) / folder.lstrip("/")
-        try:
-            a["_mtime"] = os.path.getmtime(abs_path)
-        except OSError:
-            a["_mtime"] = 0
-
-    # Sort and save top 50 to recent_albums.json
-    recent = sorted(albums, key=lambda x: x["_mtime"], reverse=True)[:50]
-    
-    with open(RECENT_FILE + ".tmp", "w") as f:
-        json.dump(recent, f, indent=2)
-    os.replace(RECENT_FILE + ".tmp", RECENT_FILE)
+    # Album folders share artist parents, so batch the stats: one scandir
+    # per artist directory covers every album inside it
+    abs_paths = [str(Path(LIB_ROOT) / a.get("folder", "").lstrip("/")) for a in albums]
+    parents = {os.path.dirname(p) for p in abs_paths}
+
+    mtimes = {}
+    with ThreadPoolExecutor(max_workers=STAT_THREADS) as ex:
+        for scanned in ex.map(scan_parent_mtimes, parents):
+            mtimes.update(scanned)
+
+    for a, abs_path in zip(albums, abs_paths):
+        a["_mtime"] = mtimes.get(abs_path) or get_album_mtime(a)
+
+    # Save the top 50 to recent_albums.json; nlargest is O(N log 50)
+    # instead of sorting the whole library
+    recent = heapq.nlargest(50, albums, key=lambda x: x["_mtime"])
+
+    # Don't leak the transient sort key into the output
+    for a in recent:
+        a.pop("_mtime", None)
+
+    atomic_write(RECENT_FILE, orjson.dumps(recent, option=JSON_OPTS))
     print(f"Updated {RECENT_FILE}")
 
 if __name__ == "__main__":
@@ -1,73 +1,219 @@
 #!/usr/bin/env python3
-import json
-import subprocess
+import functools
 import os
 import logging
-from pathlib import Path
+import sqlite3
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
-# Config from your app.py
-BEETS_CONFIG = "/config/config.yaml"
+try:
+    import orjson
+except ImportError:
+    import json as _json
+
+    class orjson:  # minimal stand-in when orjson isn't installed
+        OPT_INDENT_2 = 1
+
+        @staticmethod
+        def dumps(obj, option=0):
+            indent = 2 if option & orjson.OPT_INDENT_2 else None
+            return _json.dumps(obj, indent=indent, ensure_ascii=False).encode("utf-8")
+
+        @staticmethod
+        def loads(data):
+            return _json.loads(data)
+
+# Config from your app.py (the beets DB path matches repair_albums_table.py)
+DB_PATH = "/data/beets-library.blb"
 OUT_DIR = "/data"
 ALBUMS_FILE = os.path.join(OUT_DIR, "albums.json")
 LIB_ROOT = "/music/library"
 
+# Output is machine-consumed; compact by default, PRETTY_JSON=1 to debug
+JSON_OPTS = orjson.OPT_INDENT_2 if os.environ.get("PRETTY_JSON") == "1" else 0
+
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 logger = logging.getLogger("regen")
 
-def run_beet(args):
+def _fsync_dir(path):
+    dir_fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
     try:
-        # Use -p to ensure we aren't accidentally triggering any write-plugins
-        p = subprocess.run(
-            args, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-            text=True, check=False, timeout=300
-        )
-        return p.stdout or ""
-    except Exception as e:
-        logger.error(f"Beet query failed: {e}")
-        return ""
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+def atomic_write(path, data):
+    """Write bytes to path atomically; fsync file and directory so the
+    rename survives a crash."""
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(path)
+
+def atomic_write_json_array(path, records):
+    """Stream a JSON array record-by-record with the same atomic publish.
+
+    Serializing the whole list in one orjson.dumps holds a second copy of
+    the data as the output buffer; encoding one album at a time keeps the
+    serializer's footprint at a single record.
+    """
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(b"[")
+        for i, rec in enumerate(records):
+            if i:
+                f.write(b",\n")
+            f.write(orjson.dumps(rec, option=JSON_OPTS))
+        f.write(b"]")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(path)
+
+COVER_NAMES = ("cover.jpg", "cover.jpeg", "cover.png", "cover.webp",
+               "folder.jpg", "folder.png", "front.jpg", "front.png")
+
+def find_cover(folder_abs):
+    """Find a cover image with one scandir instead of a stat per candidate."""
+    try:
+        names = {}
+        for e in os.scandir(folder_abs):
+            names.setdefault(e.name.lower(), e.name)
+    except OSError:
+        return None
+    for cand in COVER_NAMES:
+        if cand in names:
+            return names[cand]
+    return None
+
+def _displayable(s):
+    """Frontend-safe copy of a decoded path string.
+
+    os.fsdecode keeps non-UTF8 bytes as lone surrogates, which orjson
+    refuses to encode (one bad filename would kill the whole run); turn
+    them into U+FFFD for the JSON output, like beets does for display.
+    """
+    return s.encode("utf-8", "surrogateescape").decode("utf-8", "replace")
+
+@functools.lru_cache(maxsize=None)
+def to_relative_folder(folder_abs):
+    """Library-relative folder path with a leading slash, sanitized for
+    the JSON output.
+
+    Cached: every track in an album shares its parent directory, so the
+    relpath string work runs once per unique folder, not once per track.
+    """
+    return _displayable("/" + os.path.relpath(folder_abs, LIB_ROOT).replace("\\", "/"))
+
+def open_db():
+    """Read-only connection straight to the beets SQLite library.
+
+    Skips loading the whole beets stack; plain mode=ro (not immutable=1)
+    so SQLite still honours locks while an import is writing.
+    """
+    conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
+    # Map the library file so repeat reads are served from the OS page
+    # cache without read() syscalls (256 MB covers even huge libraries)
+    conn.execute("PRAGMA mmap_size=268435456")
+    return conn
+
+def get_all_tracks(conn):
+    """Fetch every item in one query, grouped by album id.
+
+    Columns come back natively typed from SQLite, so there is nothing to
+    parse; one full table scan replaces a query per album.
+    """
+    tracks_by_album = defaultdict(list)
+    # ORDER BY pushes the disc/track sort into SQLite's C sorter, so the
+    # per-album lists are built already ordered
+    cur = conn.execute(
+        "SELECT album_id, disc, track, title, artist, length, bitrate,"
+        " format, bitdepth, samplerate, path FROM items"
+        " ORDER BY album_id, disc, COALESCE(track, 0)")
+    for (album_id, disc, track, title, artist, length, bitrate,
+         fmtc, bitdepth, samplerate, path) in cur:
+        path = os.fsdecode(path)
+        folder_abs = os.path.dirname(path)
+        tracks_by_album[album_id].append({
+            "disc": disc or 0,
+            "track": track or 0,
+            "title": title,
+            "artist": artist,
+            "length": int(length or 0),
+            "bitrate": bitrate or None,
+            "format": fmtc,
+            "bitdepth": bitdepth or None,
+            "samplerate": samplerate or None,
+            "path": f"{to_relative_folder(folder_abs)}/{_displayable(os.path.basename(path))}",
+            "_abs_path": path,
+        })
+    return tracks_by_album
 
 def regenerate():
     logger.info("Starting read-only library scan...")
-    
-    # Query Beets for all albums with specific fields
-    # Using specific delimiters to prevent parsing errors
-    fmt = "$id|$albumartist|$album|$year|$genre|$label"
-    out = run_beet(["beet", "-c", BEETS_CONFIG, "list", "-a", "-f", fmt])
-    
+
+    conn = open_db()
+    tracks_by_album = get_all_tracks(conn)
+
     albums = []
-    for line in out.splitlines():
-        parts = line.split("|")
-        if len(parts) < 6: continue
-        
-        # Get relative folder path for the frontend
-        # We query one track from the album to find the physical path
-        alb_id = parts[0]
-        path_out = run_beet(["beet", "-c", BEETS_CONFIG, "list", f"album_id:{alb_id}", "-f", "$path", "-l", "1"])
-        
+    cur = conn.execute(
+        "SELECT id, albumartist, album, year, genre, label, artpath FROM albums")
+    for alb_id, albumartist, album, year, genre, label, artpath in cur:
+        tracks = tracks_by_album.get(alb_id, [])
+
+        # Relative folder path for the frontend, from the first track
+        folder_abs = ""
         folder_rel = ""
-        if path_out:
-            abs_path = os.path.dirname(path_out.strip())
-            folder_rel = "/" + os.path.relpath(abs_path, LIB_ROOT).replace("\\", "/")
+        if tracks:
+            folder_abs = os.path.dirname(tracks[0]["_abs_path"])
+            folder_rel = to_relative_folder(folder_abs)
+        for t in tracks:
+            t.pop("_abs_path", None)
+
+        cover = None
+        if artpath:
+            cover = _displayable(
+                "/" + os.path.relpath(os.fsdecode(artpath), LIB_ROOT).replace("\\", "/"))
 
         albums.append({
             "id": alb_id,
-            "albumartist": parts[1],
-            "album": parts[2],
-            "year": parts[3],
-            "genre": parts[4],
-            "label": parts[5],
+            "albumartist": albumartist,
+            "album": album,
+            "year": year,
+            "genre": genre,
+            "label": label,
             "folder": folder_rel,
-            "cover": f"{folder_rel}/cover.jpg" if folder_rel else None
+            "cover": cover,
+            "tracks": tracks,
+            "_folder_abs": folder_abs
         })
 
-    # ATOMIC WRITE: Write to a temp file first, then rename
-    # This prevents the frontend from reading a half-written file
-    temp_file = ALBUMS_FILE + ".tmp"
-    with open(temp_file, "w", encoding="utf-8") as f:
-        json.dump(albums, f, indent=2, ensure_ascii=False)
-    
-    os.replace(temp_file, ALBUMS_FILE)
+    # Albums without a stored artpath: look for a cover file actually on
+    # disk instead of pointing the frontend at a cover.jpg that may 404.
+    # The lookup is stat-bound, so fan it out across a thread pool.
+    pending = [a for a in albums if not a["cover"] and a["_folder_abs"]]
+    folders = {a["_folder_abs"] for a in pending}
+    with ThreadPoolExecutor(max_workers=32) as ex:
+        covers = dict(zip(folders, ex.map(find_cover, folders)))
+    for a in pending:
+        cover_name = covers.get(a["_folder_abs"])
+        if cover_name:
+            a["cover"] = f"{a['folder']}/{cover_name}"
+    for a in albums:
+        a.pop("_folder_abs", None)
+    conn.close()
+
+    # Atomic publish so the frontend never reads a half-written file
+    atomic_write_json_array(ALBUMS_FILE, albums)
+
+    # JSON Lines twin (albums.jsonl): one album per line, so consumers
+    # can stream records without parsing the whole array
+    atomic_write(ALBUMS_FILE + "l",
+                 b"".join(orjson.dumps(a) + b"\n" for a in albums))
     logger.info(f"Successfully updated {len(albums)} albums in {ALBUMS_FILE}")
 
 if __name__ == "__main__":
-    regenerate()
\ No newline at end of file
+    regenerate()
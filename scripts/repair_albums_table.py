@@ -25,33 +25,39 @@ def main():
 
     print(f"Found {len(missing)} missing album rows")
 
-    # 4. Rebuild each missing album row
-    for album_id in missing:
-        # Pull representative track metadata
-        c.execute("""
+    # 4. Pull representative track metadata for every missing album in
+    # one grouped query instead of a SELECT ... LIMIT 1 per album
+    to_insert = []
+    if missing:
+        placeholders = ",".join("?" * len(missing))
+        c.execute(f"""
             SELECT
+                album_id,
                 albumartist,
                 album,
                 year,
                 mb_albumid,
                 mb_albumartistid,
-                albumtype
+                albumtype,
+                MIN(rowid)
             FROM items
-            WHERE album_id = ?
-            LIMIT 1
-        """, (album_id,))
-        row = c.fetchone()
-
-        if not row:
-            print(f"Skipping album_id {album_id}: no items found")
-            continue
-
-        albumartist, album, year, mb_albumid, mb_albumartistid, albumtype = row
-
-        print(f"Rebuilding album_id {album_id}: {albumartist} - {album}")
+            WHERE album_id IN ({placeholders})
+            GROUP BY album_id
+        """, missing)
+        found = set()
+        for row in c.fetchall():
+            album_id = row[0]
+            found.add(album_id)
+            print(f"Rebuilding album_id {album_id}: {row[1]} - {row[2]}")
+            to_insert.append(row[:7])
+        for album_id in missing:
+            if album_id not in found:
+                print(f"Skipping album_id {album_id}: no items found")
 
-        # Insert new album row
-        c.execute("""
+    # 5. Insert all rebuilt rows in one transaction; one commit/fsync
+    # instead of a WAL flush per row
+    with conn:
+        conn.executemany("""
             INSERT INTO albums (
                 id,
                 albumartist,
@@ -62,17 +68,8 @@ def main():
                 albumtype
             )
             VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
-            album_id,
-            albumartist,
-            album,
-            year,
-            mb_albumid,
-            mb_albumartistid,
-            albumtype
-        ))
+        """, to_insert)
 
-    conn.commit()
     conn.close()
     print("Album table repair complete.")
 
@@ -1,65 +1,351 @@
 #!/usr/bin/env python3
-import json
+import csv
+import operator
+import sqlite3
 import subprocess
 import os
 import time
 import logging
-from pathlib import Path
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    import orjson
+except ImportError:
+    import json as _json
+
+    class orjson:  # minimal stand-in when orjson isn't installed
+        OPT_INDENT_2 = 1
+
+        @staticmethod
+        def dumps(obj, option=0):
+            indent = 2 if option & orjson.OPT_INDENT_2 else None
+            return _json.dumps(obj, indent=indent, ensure_ascii=False).encode("utf-8")
+
+        @staticmethod
+        def loads(data):
+            return _json.loads(data)
 
 # Configuration matching your app.py
 BEETS_CONFIG = "/config/config.yaml"
 OUT_DIR = "/data"
 ALBUMS_FILE = os.path.join(OUT_DIR, "albums.json")
+SHARDS_DIR = os.path.join(OUT_DIR, "albums")
+STATE_DB = os.path.join(OUT_DIR, "regen_state.db")
 LIB_ROOT = "/music/library"
 
+# Hoisted out of the query helpers: same prefix for every beet invocation
+BEET_PREFIX = ("beet", "-c", BEETS_CONFIG, "list")
+_LIB_PREFIX = LIB_ROOT.rstrip("/") + "/"
+_LIB_LEN = len(LIB_ROOT)
+
+def to_relative_folder(p):
+    """Library-relative path with a leading slash.
+
+    LIB_ROOT is a fixed POSIX prefix in the container, so a slice
+    replaces os.path.relpath (which re-splits and re-joins both paths on
+    every call); relpath remains only as the fallback for paths outside
+    the library root."""
+    if p.startswith(_LIB_PREFIX):
+        return p[_LIB_LEN:]
+    if p == LIB_ROOT:
+        return "/"
+    return "/" + os.path.relpath(p, LIB_ROOT).replace("\\", "/")
+
+# Output is machine-consumed; compact by default, PRETTY_JSON=1 to debug
+JSON_OPTS = orjson.OPT_INDENT_2 if os.environ.get("PRETTY_JSON") == "1" else 0
+
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
 logger = logging.getLogger("smart_regen")
 
-def run_beet(args):
-    """Executes beet list with a high timeout for large libraries."""
+def atomic_write(path, data):
+    """Write bytes to path atomically; fsync file and directory so the
+    rename survives a crash."""
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    dir_fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
     try:
-        p = subprocess.run(
-            args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-            text=True, check=False, timeout=600
-        )
-        return p.stdout or ""
-    except Exception as e:
-        logger.error(f"Beet command failed: {e}")
-        return ""
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+COVER_NAMES = ("cover.jpg", "cover.jpeg", "cover.png", "cover.webp",
+               "folder.jpg", "folder.png", "front.jpg", "front.png")
+
+def find_cover(folder_abs):
+    """Find a cover image with one directory listing instead of a stat
+    probe per candidate filename."""
+    try:
+        names = {}
+        for e in os.scandir(folder_abs):
+            names.setdefault(e.name.lower(), e.name)
+    except OSError:
+        return None
+    for cand in COVER_NAMES:
+        if cand in names:
+            return names[cand]
+    return None
+
+def _scan_artist(artist_path):
+    """One artist directory: album folder path -> mtime."""
+    mtimes = {}
+    try:
+        with os.scandir(artist_path) as album_it:
+            for alb in album_it:
+                if alb.is_dir(follow_symlinks=False) and not alb.name.startswith("."):
+                    mtimes[alb.path] = alb.stat(follow_symlinks=False).st_mtime
+    except OSError:
+        pass
+    return mtimes
+
+def get_all_albums():
+    """Map every album folder under LIB_ROOT (artist/album layout) to its
+    mtime.
+
+    os.scandir gives is_dir() straight from the readdir batch and one
+    stat per album directory, instead of a fresh os.stat path walk for
+    each album in the main loop. Artist directories are independent, so
+    their listings run on a thread pool to keep stats in flight on
+    high-latency storage."""
+    mtimes = {}
+    try:
+        with os.scandir(LIB_ROOT) as it:
+            artists = [art.path for art in it
+                       if art.is_dir(follow_symlinks=False) and not art.name.startswith(".")]
+    except OSError:
+        return mtimes
+    with ThreadPoolExecutor(max_workers=16) as ex:
+        for scanned in ex.map(_scan_artist, artists):
+            mtimes.update(scanned)
+    return mtimes
+
+def open_state_db():
+    """Per-folder cycle state in SQLite instead of a rewrite-everything
+    JSON file: WAL keeps writes cheap and updates cost O(changed rows),
+    not O(library)."""
+    con = sqlite3.connect(STATE_DB)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS state("
+        " folder TEXT PRIMARY KEY,"
+        " last_checked REAL,"
+        " mtime REAL,"
+        " no_cover INTEGER NOT NULL DEFAULT 0)")
+    return con
+
+def load_state(con):
+    """Pull the state table into plain dicts for the hot loop."""
+    album_state = {}
+    no_cover = {}
+    for folder, checked, mtime, nc in con.execute(
+            "SELECT folder, last_checked, mtime, no_cover FROM state"):
+        album_state[folder] = {"checked": checked, "mtime": mtime}
+        if nc:
+            no_cover[folder] = mtime
+    return album_state, no_cover
+
+def save_state(con, changed, album_state, no_cover):
+    """Upsert only the folders touched this cycle in one transaction."""
+    rows = [(folder,
+             album_state.get(folder, {}).get("checked"),
+             album_state.get(folder, {}).get("mtime"),
+             1 if folder in no_cover else 0)
+            for folder in changed]
+    with con:
+        con.executemany(
+            "INSERT INTO state(folder, last_checked, mtime, no_cover)"
+            " VALUES(?, ?, ?, ?)"
+            " ON CONFLICT(folder) DO UPDATE SET"
+            " last_checked=excluded.last_checked,"
+            " mtime=excluded.mtime,"
+            " no_cover=excluded.no_cover", rows)
+
+def is_album_current(prev_state, folder_mtime):
+    """True when the album folder's mtime matches what the last
+    successful cycle recorded, i.e. nothing on disk changed."""
+    return (folder_mtime is not None and prev_state is not None
+            and prev_state.get("mtime") == folder_mtime)
+
+def load_previous_albums():
+    """Previous run's output keyed by album id, so entries whose folder
+    hasn't changed can be reused without re-probing."""
+    try:
+        with open(ALBUMS_FILE, "rb") as f:
+            return {a.get("id"): a for a in orjson.loads(f.read())}
+    except (OSError, ValueError):
+        return {}
+
+def start_beet(args):
+    """Launch beet with stdout piped so output can be consumed as a stream."""
+    return subprocess.Popen(
+        args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        text=True, bufsize=1
+    )
+
+def iter_beet(proc):
+    """Yield output lines as the process produces them.
+
+    Streaming means the caller never holds the whole listing (megabytes
+    of tab-separated rows on a big library) plus its splitlines() copy in
+    memory at once."""
+    try:
+        for line in proc.stdout:
+            yield line.rstrip("\n")
+    finally:
+        proc.stdout.close()
+        proc.wait()
+
+def _to_int(s, d=None):
+    """int(s) without raising: the common valid-number case takes a
+    branch instead of exception machinery."""
+    return int(s) if s and s.lstrip("-").isdigit() else d
+
+def _to_hz(s, d=None):
+    """beet prints samplerates as e.g. 44.1kHz; convert back to Hz."""
+    try:
+        return int(float(s.replace("kHz", "").strip()) * 1000) if s else d
+    except ValueError:
+        return d
+
+def get_tracks(trk_proc):
+    """Parse the streamed bulk track listing into per-album lists.
+
+    beet prints human formats (M:SS lengths, kbps bitrates, kHz
+    samplerates), so fields are converted back to the numbers the
+    frontend expects."""
+    tracks_by_id = defaultdict(list)
+    # csv.reader splits rows in C; QUOTE_NONE because beet output is
+    # plain tab-delimited text, not quoted CSV
+    reader = csv.reader(iter_beet(trk_proc), delimiter="\t", quoting=csv.QUOTE_NONE)
+    for parts in reader:
+        if len(parts) < 11: continue
+        (alb_id, disc, track, title, artist, length,
+         bitrate, fmtc, bitdepth, samplerate, path) = parts[:11]
+        if len(parts) > 11:
+            # a tab inside the trailing path field got split; restore it
+            path = "\t".join(parts[10:])
+
+        alb_id = _to_int(alb_id)
+        if alb_id is None: continue
+
+        disc = _to_int(disc, 0)
+        track = _to_int(track, 0)
+
+        # beet prints length as M:SS (or H:MM:SS)
+        seconds = 0
+        for p in length.split(":"):
+            if not p.isdigit():
+                seconds = 0
+                break
+            seconds = seconds * 60 + int(p)
+
+        kbps = _to_int(bitrate.replace("kbps", "").strip())
+        bitrate = kbps * 1000 if kbps is not None else None
+        bitdepth = _to_int(bitdepth)
+        samplerate = _to_hz(samplerate)
+
+        tracks_by_id[alb_id].append({
+            "disc": disc,
+            "track": track,
+            "title": title,
+            "artist": artist,
+            "length": seconds,
+            "bitrate": bitrate,
+            "format": fmtc,
+            "bitdepth": bitdepth,
+            "samplerate": samplerate,
+            "path": to_relative_folder(path),
+        })
+
+    sort_key = operator.itemgetter("disc", "track")
+    for tracks in tracks_by_id.values():
+        tracks.sort(key=sort_key)
+    return tracks_by_id
 
 def process_cycle():
     logger.info("Starting read-only regeneration...")
-    
-    # 1. Fetch Albums
-    alb_fmt = "$id\t$albumartist\t$album\t$year\t$genre\t$label"
-    alb_out = run_beet(["beet", "-c", BEETS_CONFIG, "list", "-a", "-f", alb_fmt])
-    
-    # 2. Fetch Tracks (to find folder paths)
-    trk_fmt = "$album_id\t$path"
-    trk_out = run_beet(["beet", "-c", BEETS_CONFIG, "list", "-f", trk_fmt])
-    
-    path_map = {}
-    for line in trk_out.splitlines():
-        p = line.split("\t")
-        if len(p) < 2: continue
-        # Just store the first path found for each album_id
-        if p[0] not in path_map:
-            path_map[p[0]] = os.path.dirname(p[1])
+    state_con = open_state_db()
+    # album_state: per-folder {"checked": ts, "mtime": m} from the last
+    # successful cycle; no_cover: folders known to lack a cover, keyed
+    # to the folder mtime at probe time. Together they let unchanged
+    # folders skip filesystem probing entirely.
+    album_state, no_cover = load_state(state_con)
+    prev_albums = load_previous_albums()
+    now = time.time()
+
+    # 1+2. Fetch albums and tracks. The two bulk queries are
+    # independent, so start both beet processes up front and let the
+    # small album listing fill its pipe while the much larger track
+    # stream is consumed.
+    # $path on a -a query resolves to the album directory, so the folder
+    # comes straight from the one-row-per-album listing instead of being
+    # reconstructed from the first track path
+    alb_fmt = "$id\t$albumartist\t$album\t$year\t$genre\t$label\t$path"
+    trk_fmt = ("$album_id\t$disc\t$track\t$title\t$artist\t$length"
+               "\t$bitrate\t$format\t$bitdepth\t$samplerate\t$path")
+    try:
+        alb_proc = start_beet([*BEET_PREFIX, "-a", "-f", alb_fmt])
+        trk_proc = start_beet([*BEET_PREFIX, "-f", trk_fmt])
+    except OSError as e:
+        logger.error(f"Beet command failed: {e}")
+        return
+
+    tracks_by_id = get_tracks(trk_proc)
+
+    # One scandir walk of the library supplies every album folder mtime;
+    # the loop below no longer stats each folder individually
+    folder_mtimes = get_all_albums()
 
     output = []
-    for line in alb_out.splitlines():
-        parts = line.split("\t")
-        if len(parts) < 6: continue
-        
-        album_id = parts[0]
-        folder_abs = path_map.get(album_id, "")
+    append = output.append
+    state_changed = set()
+    for line in iter_beet(alb_proc):
+        parts = line.split("\t", 6)
+        if len(parts) < 7: continue
+
+        # Integer ids match regenerate_albums.py's output and make the
+        # index lookups a single int hash instead of string hashing
+        album_id = _to_int(parts[0])
+        if album_id is None: continue
+        folder_abs = parts[6]
         folder_rel = ""
-        
+        cover = None
+
         if folder_abs:
-            folder_rel = "/" + os.path.relpath(folder_abs, LIB_ROOT).replace("\\", "/")
+            folder_rel = to_relative_folder(folder_abs)
+            folder_mtime = folder_mtimes.get(folder_abs)
+            prev_state = album_state.get(folder_abs)
+            prev = prev_albums.get(album_id)
+            if prev is not None and is_album_current(prev_state, folder_mtime):
+                # Folder untouched since the last successful cycle: reuse
+                # the previous entry's cover instead of probing again.
+                # Metadata still comes fresh from the query below.
+                cover = prev.get("cover")
+            elif folder_mtime is not None and no_cover.get(folder_abs) == folder_mtime:
+                # Had no cover last cycle and hasn't changed: skip the
+                # directory listing.
+                pass
+            else:
+                # One listing of the album folder instead of assuming
+                # cover.jpg exists (and making the frontend 404 when it doesn't)
+                cover_name = find_cover(folder_abs)
+                if cover_name:
+                    if no_cover.pop(folder_abs, None) is not None:
+                        state_changed.add(folder_abs)
+                    cover = f"{folder_rel}/{cover_name}"
+                elif folder_mtime is not None:
+                    no_cover[folder_abs] = folder_mtime
+                    state_changed.add(folder_abs)
+            if folder_mtime is not None and not is_album_current(prev_state, folder_mtime):
+                album_state[folder_abs] = {"checked": now, "mtime": folder_mtime}
+                state_changed.add(folder_abs)
 
-        output.append({
+        append({
             "id": album_id,
             "albumartist": parts[1],
             "album": parts[2],
@@ -67,16 +353,52 @@ def process_cycle():
             "genre": parts[4],
             "label": parts[5],
             "folder": folder_rel,
-            "cover": f"{folder_rel}/cover.jpg" if folder_rel else None
+            "cover": cover,
+            "tracks": tracks_by_id.get(album_id, [])
         })
 
-    # ATOMIC WRITE: Write to temp, then replace
-    temp_file = ALBUMS_FILE + ".tmp"
-    with open(temp_file, "w", encoding="utf-8") as f:
-        json.dump(output, f, indent=2, ensure_ascii=False)
-    
-    os.replace(temp_file, ALBUMS_FILE)
-    logger.info(f"Successfully wrote {len(output)} albums to {ALBUMS_FILE}")
+    # Skip the serialize + fsync entirely when this cycle produced the
+    # same albums as the last one — the steady-state case on idle runs
+    dirty = (len(output) != len(prev_albums)
+             or any(prev_albums.get(a["id"]) != a for a in output))
+    if dirty:
+        # Atomic publish: temp file + replace, with directory fsync
+        atomic_write(ALBUMS_FILE, orjson.dumps(output, option=JSON_OPTS))
+
+        # JSON Lines twin for streamed consumers (one album per line)
+        atomic_write(ALBUMS_FILE + "l",
+                     b"".join(orjson.dumps(a) + b"\n" for a in output))
+
+        # Per-album shards: one track edit rewrites one small file, not
+        # the whole library. Only changed ids are rewritten; the
+        # manifest lists everything so consumers can fetch selectively.
+        os.makedirs(SHARDS_DIR, exist_ok=True)
+        index = {}
+        shards_written = 0
+        for a in output:
+            index[str(a["id"])] = {"albumartist": a["albumartist"],
+                                   "album": a["album"],
+                                   "folder": a["folder"]}
+            if prev_albums.get(a["id"]) != a:
+                atomic_write(os.path.join(SHARDS_DIR, f"{a['id']}.json"),
+                             orjson.dumps(a, option=JSON_OPTS))
+                shards_written += 1
+        current_ids = {a["id"] for a in output}
+        for old_id in prev_albums.keys() - current_ids:
+            try:
+                os.remove(os.path.join(SHARDS_DIR, f"{old_id}.json"))
+            except OSError:
+                pass
+        atomic_write(os.path.join(SHARDS_DIR, "index.json"),
+                     orjson.dumps(index, option=JSON_OPTS))
+
+        logger.info(f"Successfully wrote {len(output)} albums"
+                    f" ({shards_written} shards) to {ALBUMS_FILE}")
+    else:
+        logger.info(f"No changes across {len(output)} albums; output left as is")
+    if state_changed:
+        save_state(state_con, state_changed, album_state, no_cover)
+    state_con.close()
 
 if __name__ == "__main__":
     process_cycle()